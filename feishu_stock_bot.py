@@ -9,17 +9,81 @@
 """
 
 import os
+import re
+import sys
 import json
 import time
+import atexit
+import logging
+import logging.handlers
 import sqlite3
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import queue
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Optional
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import parse_qs
-import hashlib
-import hmac
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 可选依赖：安装了 orjson 就用它解析/序列化 JSON（直接处理 bytes，更快），否则用标准库
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson:
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+else:
+    _json_loads = json.loads  # 标准库同样直接接受 bytes
+
+    def _json_dumps(obj) -> bytes:
+        """序列化为紧凑的 UTF-8 JSON 字节串（与 orjson.dumps 输出一致）"""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+
+# ===== 日志 =====
+logger = logging.getLogger("stock_bot")
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """记录原样入队，消息拼接和格式化都留给 QueueListener 所在的后台线程"""
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 默认实现会在调用线程里先格式化一遍；同进程队列不需要序列化，直接传递即可
+        return record
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """日志先进入队列，由后台线程统一输出；监控和发送线程只做入队，不阻塞在 stdout 上"""
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter("[%(levelname)s] %(asctime)s %(message)s", datefmt="%H:%M:%S"))
+    listener = logging.handlers.QueueListener(log_queue, stream)
+    logger.addHandler(_DeferredQueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    listener.start()
+    atexit.register(listener.stop)  # 退出前输出队列中剩余的日志
+    return listener
+
+# ===== HTTP 会话 =====
+# 全局复用连接池（keep-alive），避免每次请求都重新建立 TCP/TLS 连接
+# 并发发起网络请求的线程数；每个主机的连接池按它的两倍设置，线程池跑满时也不会丢弃连接
+FETCH_WORKERS = 8
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=FETCH_WORKERS * 2))
+# 腾讯行情接口(http)均为幂等 GET，连接失败/5xx 时自动重试
+SESSION.mount("http://", HTTPAdapter(
+    pool_connections=4, pool_maxsize=FETCH_WORKERS * 2,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504)),
+))
+# 腾讯接口超时：(连接, 读取) 秒；连接超时短一些，尽快进入重试
+QUOTE_TIMEOUT = (1.0, 4.0)
 
 # ===== 配置区 =====
 class Config:
@@ -67,227 +131,345 @@ class Config:
 
 # ===== 数据库管理 =====
 class Database:
+    # 热路径 SQL 固定为同一字符串，命中 sqlite3 的预编译语句缓存
+    INSERT_PRICE_SQL = "INSERT INTO price_history (code, price, volume, timestamp) VALUES (?, ?, ?, ?)"
+    # 每只股票只保留最近N条；按代码分组编号，一条语句清理全部股票
+    PRUNE_PRICE_SQL = (
+        "DELETE FROM price_history WHERE id IN ("
+        "SELECT id FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY code ORDER BY id DESC) AS rn "
+        "FROM price_history) WHERE rn > ?)"
+    )
+    
     def __init__(self, db_path: str):
         self.db_path = db_path
+        # 整个进程复用同一个连接（监控线程 / Webhook 线程共享），用锁串行化访问
+        self._lock = threading.Lock()
+        self._conn = self._connect()
         self.init_db()
     
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库连接并应用性能相关的 PRAGMA"""
+        # isolation_level=None: 单条语句自动提交，需要批量写入时用 _transaction() 显式开启事务
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, cached_statements=256)
+        # Row 在 C 层实现，支持 row["code"] 和下标访问，无需在 Python 里逐行构造字典
+        conn.row_factory = sqlite3.Row
+        # WAL 模式：写入不再重写回滚日志；NORMAL 同步：每次提交少一次 fsync
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")  # 其他进程(如 --once 任务)持有写锁时等待而非立即报错
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-20000")  # 约20MB页缓存
+        conn.execute("PRAGMA mmap_size=268435456")  # 256MB 内存映射
+        return conn
+    
+    @contextmanager
+    def _transaction(self):
+        """加锁并开启一个写事务，正常退出时提交，异常时回滚"""
+        with self._lock:
+            # IMMEDIATE: 事务开始即获取写锁，避免读后升级写锁时与其他写者冲突
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+    
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+    
     def init_db(self):
         """初始化数据库"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 监控股票表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS monitor_stocks (
-                code TEXT PRIMARY KEY,
-                name TEXT,
-                added_time TEXT,
-                user_id TEXT
-            )
-        """)
-        
-        # 价格历史表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS price_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code TEXT,
-                price REAL,
-                volume REAL,
-                timestamp TEXT
-            )
-        """)
-        
-        # 预警记录表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS alert_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code TEXT,
-                alert_type TEXT,
-                content TEXT,
-                timestamp TEXT
-            )
-        """)
+        with self._transaction() as conn:
+            # 旧版本 timestamp 为 ISO 字符串(TEXT)，先改名，建好新表后再迁移数据
+            legacy = [t for t in ("price_history", "alert_history") if self._has_text_timestamp(conn, t)]
+            for table in legacy:
+                conn.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+            
+            # 监控股票表
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS monitor_stocks (
+                    code TEXT PRIMARY KEY,
+                    name TEXT,
+                    added_time TEXT,
+                    user_id TEXT
+                )
+            """)
+            
+            # 价格历史表（timestamp 为 unix 秒）
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS price_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    code TEXT,
+                    price REAL,
+                    volume REAL,
+                    timestamp INTEGER
+                )
+            """)
+            
+            # 预警记录表（timestamp 为 unix 秒）
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS alert_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    code TEXT,
+                    alert_type TEXT,
+                    content TEXT,
+                    timestamp INTEGER
+                )
+            """)
+            
+            for table in legacy:
+                self._migrate_timestamp(conn, table)
+            
+            # 按代码取最近N条 / 清理旧记录都走 (code, id) 索引，避免全表扫描+排序
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_price_code_id ON price_history(code, id DESC)")
         
-        conn.commit()
-        conn.close()
+        # 启动时更新一次统计信息，帮助查询规划器选用索引
+        with self._lock:
+            self._conn.execute("ANALYZE")
         
         # 如果有环境变量配置的股票，自动添加
         if Config.STOCK_LIST:
             self.sync_env_stocks()
             
+    @staticmethod
+    def _has_text_timestamp(conn: sqlite3.Connection, table: str) -> bool:
+        """表是否为旧版的 TEXT 类型 timestamp"""
+        columns = {row[1]: row[2] for row in conn.execute(f"PRAGMA table_info({table})")}
+        return columns.get("timestamp", "").upper() == "TEXT"
+    
+    @staticmethod
+    def _migrate_timestamp(conn: sqlite3.Connection, table: str):
+        """把 {table}_legacy 的数据迁入新表，本地时间 ISO 字符串转换为 unix 秒"""
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        select = ", ".join(
+            "CAST(strftime('%s', timestamp, 'utc') AS INTEGER)" if c == "timestamp" else c for c in columns
+        )
+        conn.execute(f"INSERT INTO {table} ({', '.join(columns)}) SELECT {select} FROM {table}_legacy")
+        conn.execute(f"DROP TABLE {table}_legacy")
+        logger.info("已迁移 %s.timestamp 为 unix 时间戳", table)
+    
     def sync_env_stocks(self):
         """同步环境变量中的股票到数据库"""
         if not Config.STOCK_LIST:
-            print("[WARN] 环境变量 STOCK_LIST 为空")
+            logger.warning("环境变量 STOCK_LIST 为空")
             return
 
-        codes = Config.STOCK_LIST.split(",")
-        print(f"[INFO] 检测到环境变量配置股票: {len(codes)}只 -> {codes}")
-        for code in codes:
-            code = code.strip()
-            if not code: continue
-            # 简单检查是否已存在，不存在则获取信息添加
-            # 这里为了简单，每次启动都尝试添加（add_stock有去重）
-            try:
-                # 只有当数据库里没有这个名字时才去联网获取，避免每次启动都大量请求
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute("SELECT name FROM monitor_stocks WHERE code=?", (StockDataFetcher.normalize_code(code),))
-                res = cursor.fetchone()
-                conn.close()
-                
-                if not res:
-                    data = StockDataFetcher.get_stock_data(code)
-                    if data:
-                        self.add_stock(data["code"], data["name"])
-                        print(f"[INFO] 自动添加股票: {data['name']}")
-                    else:
-                        print(f"[WARN] 获取股票数据失败: {code}")
-            except Exception as e:
-                print(f"[WARN] 自动添加股票失败 {code}: {e}")
+        codes = [c.strip() for c in Config.STOCK_LIST.split(",") if c.strip()]
+        logger.info("检测到环境变量配置股票: %s只 -> %s", len(codes), codes)
+        try:
+            # 只有数据库里还没有的股票才去联网获取，避免每次启动都大量请求
+            with self._lock:
+                existing = {row[0] for row in self._conn.execute("SELECT code FROM monitor_stocks")}
+            # 每个代码只标准化一次，同时去掉 600519 / sh600519 这类重复写法
+            missing = {}
+            for c in codes:
+                norm = StockDataFetcher.normalize_code(c)
+                if norm not in existing:
+                    missing.setdefault(norm, c)
+            if not missing:
+                return
+            
+            # 一次请求获取全部缺失股票，一个事务写入
+            quotes = StockDataFetcher.get_many(list(missing))
+            self.add_stocks([(data["code"], data["name"]) for data in quotes.values()])
+            for data in quotes.values():
+                logger.info("自动添加股票: %s", data['name'])
+            for norm, code in missing.items():
+                if norm not in quotes:
+                    logger.warning("获取股票数据失败: %s", code)
+        except Exception as e:
+            logger.warning("自动添加股票失败: %s", e)
     
     def add_stock(self, code: str, name: str, user_id: str = ""):
         """添加监控股票"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
         try:
-            cursor.execute(
-                "INSERT OR REPLACE INTO monitor_stocks (code, name, added_time, user_id) VALUES (?, ?, ?, ?)",
-                (code, name, datetime.now().isoformat(), user_id)
-            )
-            conn.commit()
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO monitor_stocks (code, name, added_time, user_id) VALUES (?, ?, ?, ?)",
+                    (code, name, datetime.now().isoformat(), user_id)
+                )
             return True
         except Exception as e:
-            print(f"[ERROR] 添加股票失败: {e}")
+            logger.error("添加股票失败: %s", e)
             return False
-        finally:
-            conn.close()
+    
+    def add_stocks(self, rows: List[Tuple[str, str]], user_id: str = ""):
+        """批量添加监控股票 [(code, name), ...]（单事务）"""
+        if not rows:
+            return
+        now = datetime.now().isoformat()
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO monitor_stocks (code, name, added_time, user_id) VALUES (?, ?, ?, ?)",
+                [(code, name, now, user_id) for code, name in rows]
+            )
     
     def remove_stock(self, code: str):
         """移除监控股票"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM monitor_stocks WHERE code = ?", (code,))
-        conn.commit()
-        conn.close()
-    
-    def get_all_stocks(self) -> List[Dict]:
-        """获取所有监控股票"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT code, name FROM monitor_stocks")
-        stocks = [{"code": row[0], "name": row[1]} for row in cursor.fetchall()]
-        conn.close()
-        return stocks
+        with self._lock:
+            self._conn.execute("DELETE FROM monitor_stocks WHERE code = ?", (code,))
+    
+    def get_all_stocks(self) -> List[sqlite3.Row]:
+        """获取所有监控股票（按 row["code"] / row["name"] 访问）"""
+        with self._lock:
+            return self._conn.execute("SELECT code, name FROM monitor_stocks").fetchall()
     
     def add_price_record(self, code: str, price: float, volume: float):
         """添加价格记录"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO price_history (code, price, volume, timestamp) VALUES (?, ?, ?, ?)",
-            (code, price, volume, datetime.now().isoformat())
-        )
-        # 只保留最近100条记录
-        cursor.execute("""
-            DELETE FROM price_history 
-            WHERE code = ? AND id NOT IN (
-                SELECT id FROM price_history WHERE code = ? ORDER BY id DESC LIMIT 100
-            )
-        """, (code, code))
-        conn.commit()
-        conn.close()
+        self.add_price_records_bulk([(code, price, volume, int(time.time()))])
+    
+    def add_price_records_bulk(self, rows: List[tuple]):
+        """批量添加价格记录（整批一个事务，只提交一次）"""
+        if not rows:
+            return
+        with self._transaction() as conn:
+            conn.executemany(self.INSERT_PRICE_SQL, rows)
+    
+    def prune_history(self, max_per_code: int = 100):
+        """清理价格历史，每只股票只保留最近 max_per_code 条（维护用，按需手动调用）"""
+        with self._transaction() as conn:
+            conn.execute(self.PRUNE_PRICE_SQL, (max_per_code,))
     
     def get_price_history(self, code: str, limit: int = 20) -> List[float]:
         """获取价格历史"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT price FROM price_history WHERE code = ? ORDER BY id DESC LIMIT ?",
-            (code, limit)
-        )
-        prices = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        return list(reversed(prices))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT price FROM price_history WHERE code = ? ORDER BY id DESC LIMIT ?",
+                (code, limit)
+            ).fetchall()
+        return [row[0] for row in reversed(rows)]
     
     def get_volume_history(self, code: str, limit: int = 5) -> List[float]:
         """获取成交量历史"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT volume FROM price_history WHERE code = ? ORDER BY id DESC LIMIT ?",
-            (code, limit)
-        )
-        volumes = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        return list(reversed(volumes))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT volume FROM price_history WHERE code = ? ORDER BY id DESC LIMIT ?",
+                (code, limit)
+            ).fetchall()
+        return [row[0] for row in reversed(rows)]
 
 
 # ===== 股票数据获取 =====
+def _compile_quote_re(indices) -> re.Pattern:
+    """
+    按字段下标生成只捕获所需字段的正则（分隔符兼容半角~和全角～）
+    匹配整段响应中的每一行 v_xxx="..."，第1组为股票代码，其后依次为各字段
+    """
+    sep, field = "[~～]", "[^~～\n]*"
+    pattern, pos = r'^v_(\w+)="', -1
+    for idx in indices:
+        if pos < 0:
+            pattern += f"(?:{field}{sep}){{{idx}}}({field})"
+        else:
+            pattern += f"{sep}(?:{field}{sep}){{{idx - pos - 1}}}({field})"
+        pos = idx
+    return re.compile(pattern, re.MULTILINE)
+
+
+# 腾讯行情字段下标: 名称、现价、昨收、今开、成交量、时间、最高、最低、成交额
+_QUOTE_RE = _compile_quote_re((1, 3, 4, 5, 6, 30, 33, 34, 37))
+
+# 代码首位数字 -> 市场前缀（6沪市，0/3深市，4/8北交所）
+_MARKET_BY_FIRST = {'6': 'sh', '0': 'sz', '3': 'sz', '4': 'bj', '8': 'bj'}
+
+
 class StockDataFetcher:
+    QUOTE_BATCH_SIZE = 50  # 单次行情请求最多包含的股票数
+    
     @staticmethod
+    @lru_cache(maxsize=1024)
     def normalize_code(code: str) -> str:
-        """标准化股票代码"""
+        """标准化股票代码（结果缓存，同一代码每轮会被多次标准化）"""
         code = code.strip().upper()
         # 移除常见前缀
-        for prefix in ['SH', 'SZ', 'BJ']:
-            if code.startswith(prefix):
-                code = code[2:]
-                break
+        if code[:2] in ('SH', 'SZ', 'BJ'):
+            code = code[2:]
         
-        # 添加市场前缀
+        # 按首位数字查表添加市场前缀
         if code.isdigit():
-            if code.startswith('6'):
-                return f"sh{code}"
-            elif code.startswith(('0', '3')):
-                return f"sz{code}"
-            elif code.startswith(('4', '8')):
-                return f"bj{code}"
+            market = _MARKET_BY_FIRST.get(code[0])
+            if market:
+                return market + code
         
         return code.lower()
     
+    @staticmethod
+    def _decode(resp: requests.Response) -> str:
+        """解码腾讯接口响应（通常返回 GBK）"""
+        try:
+            return resp.content.decode('gbk')
+        except UnicodeDecodeError:
+            return resp.text
+    
+    @staticmethod
+    def _parse_quote(m: re.Match) -> Dict:
+        """把 _QUOTE_RE 的匹配结果转换为行情数据"""
+        code, name, price, pre_close, open_, volume, quote_time, high, low, amount = m.groups()
+        
+        return {
+            "name": name,
+            "code": code,
+            "price": float(price) if price else 0,
+            "pre_close": float(pre_close) if pre_close else 0,
+            "open": float(open_) if open_ else 0,
+            "high": float(high) if high else 0,
+            "low": float(low) if low else 0,
+            "volume": float(volume) if volume else 0,  # 成交量(手)
+            "amount": float(amount) if amount else 0,  # 成交额(万)
+            "time": quote_time
+        }
+    
     @staticmethod
     def get_stock_data(code: str) -> Optional[Dict]:
-        """从腾讯接口获取股票实时数据"""
+        """从腾讯接口获取股票实时数据（单只股票的批量请求，与 get_many 共用解析逻辑）"""
         normalized_code = StockDataFetcher.normalize_code(code)
-        url = f"http://qt.gtimg.cn/q={normalized_code}"
+        # 未知代码返回 v_pv_none_match="1"; 不含字段，结果中不会出现
+        return StockDataFetcher._fetch_batch([normalized_code]).get(normalized_code)
+    
+    @staticmethod
+    def get_many(codes: List[str]) -> Dict[str, Dict]:
+        """批量获取多只股票实时数据，返回 {标准化代码: 数据}"""
+        normalized = sorted(set(StockDataFetcher.normalize_code(c) for c in codes))
+        result = {}
+        # 腾讯接口支持 q=sh600519,sz000001,... 一次返回多行 v_xxx="...";
+        # 股票很多时分批请求，控制 URL 长度，单批失败也不影响其他批次
+        size = StockDataFetcher.QUOTE_BATCH_SIZE
+        batches = [normalized[i:i + size] for i in range(0, len(normalized), size)]
+        if len(batches) <= 1:
+            for batch in batches:
+                result.update(StockDataFetcher._fetch_batch(batch))
+            return result
+        # 多个批次并发请求，总耗时约为一次往返
+        with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(batches))) as pool:
+            for part in pool.map(StockDataFetcher._fetch_batch, batches):
+                result.update(part)
+        return result
+    
+    @staticmethod
+    def _fetch_batch(codes: List[str]) -> Dict[str, Dict]:
+        """一次请求获取一批已标准化代码的行情"""
+        wanted = set(codes)
+        url = "http://qt.gtimg.cn/q=" + ",".join(codes)
         
+        result = {}
         try:
-            resp = requests.get(url, timeout=5)
+            resp = SESSION.get(url, timeout=QUOTE_TIMEOUT)
             resp.raise_for_status()
-            
-            # 解析数据
-            # 尝试使用 GBK 解码（腾讯接口通常返回 GBK）
-            try:
-                text = resp.content.decode('gbk')
-            except UnicodeDecodeError:
-                text = resp.text
-                
-            if "pv_none_match" in text:
-                return None
-            
-            data = text.split("~")
-            if len(data) < 35:
-                # 兼容全角波浪号
-                data = text.split("～")
-                if len(data) < 35:
-                    return None
-            
-            return {
-                "name": data[1],
-                "code": normalized_code,
-                "price": float(data[3]) if data[3] else 0,
-                "pre_close": float(data[4]) if data[4] else 0,
-                "open": float(data[5]) if data[5] else 0,
-                "high": float(data[33]) if data[33] else 0,
-                "low": float(data[34]) if data[34] else 0,
-                "volume": float(data[6]) if data[6] else 0,  # 成交量(手)
-                "amount": float(data[37]) if data[37] else 0,  # 成交额(万)
-                "time": data[30]
-            }
+            # 一个正则在整段响应上逐行匹配，只提取用到的字段
+            for m in _QUOTE_RE.finditer(StockDataFetcher._decode(resp)):
+                code = m.group(1)
+                if code not in wanted:
+                    continue
+                try:
+                    result[code] = StockDataFetcher._parse_quote(m)
+                except ValueError as e:
+                    logger.error("解析 %s 数据失败: %s", code, e)
         except Exception as e:
-            print(f"[ERROR] 获取 {code} 数据失败: {e}")
-            return None
+            logger.error("批量获取行情失败 %s: %s", ",".join(codes), e)
+        return result
 
     @staticmethod
     def get_kline_history(code: str, scale: str = 'day', limit: int = 60) -> List[Dict]:
@@ -302,7 +484,7 @@ class StockDataFetcher:
         url = f"http://web.ifzq.gtimg.cn/appstock/app/fqkline/get?param={normalized_code},{scale},,,{limit},qfq"
         
         try:
-            resp = requests.get(url, timeout=5)
+            resp = SESSION.get(url, timeout=QUOTE_TIMEOUT)
             if resp.status_code != 200:
                 return []
             
@@ -328,23 +510,60 @@ class StockDataFetcher:
                         })
                 return history
         except Exception as e:
-            print(f"[ERROR] 获取K线失败 {code}: {e}")
+            logger.error("获取K线失败 %s: %s", code, e)
         return []
 
 
 # ===== 技术指标计算 =====
+class RollingBoll:
+    """固定周期的滚动布林带：窗口内维护和与平方和，收盘价入窗与实时价试算都是 O(1)"""
+    __slots__ = ("period", "std_dev", "window", "s", "s2")
+    
+    def __init__(self, period: int = 20, std_dev: int = 2):
+        self.period = period
+        self.std_dev = std_dev
+        # 只保存 period-1 根已收盘K线，最后一格留给实时价
+        self.window: deque = deque(maxlen=period - 1)
+        self.s = 0.0
+        self.s2 = 0.0
+    
+    def push(self, price: float):
+        """加入一根已收盘K线，窗口满时移出最旧的一根"""
+        if len(self.window) == self.window.maxlen:
+            old = self.window[0]
+            self.s -= old
+            self.s2 -= old * old
+        self.window.append(price)
+        self.s += price
+        self.s2 += price * price
+    
+    @property
+    def ready(self) -> bool:
+        return len(self.window) == self.window.maxlen
+    
+    def update(self, price: float) -> Optional[Dict[str, float]]:
+        """以实时价作为当前K线计算布林带（不改变窗口）"""
+        if not self.ready:
+            return None
+        mb = (self.s + price) / self.period
+        variance = max((self.s2 + price * price) / self.period - mb * mb, 0)
+        std = variance ** 0.5
+        return {"up": mb + self.std_dev * std, "mb": mb, "dn": mb - self.std_dev * std}
+
+
 class TechnicalAnalysis:
     @staticmethod
     def calculate_ema(prices: List[float], period: int) -> List[float]:
         """计算EMA"""
         if not prices: return []
-        ema = []
         multiplier = 2 / (period + 1)
-        for i, price in enumerate(prices):
-            if i == 0:
-                ema.append(price)
-            else:
-                ema.append((price - ema[-1]) * multiplier + ema[-1])
+        # 首值作为初值，之后用局部变量递推，避免每步 enumerate 判断和 ema[-1] 索引
+        value = prices[0]
+        ema = [value]
+        append = ema.append
+        for price in prices[1:]:
+            value += (price - value) * multiplier
+            append(value)
         return ema
 
     @staticmethod
@@ -353,40 +572,87 @@ class TechnicalAnalysis:
         if len(prices) < slow + signal:
             return None
         
-        ema_fast = TechnicalAnalysis.calculate_ema(prices, fast)
-        ema_slow = TechnicalAnalysis.calculate_ema(prices, slow)
-        
-        # 确保长度一致，从后面对齐
-        min_len = min(len(ema_fast), len(ema_slow))
-        ema_fast = ema_fast[-min_len:]
-        ema_slow = ema_slow[-min_len:]
-        
-        dif = [f - s for f, s in zip(ema_fast, ema_slow)]
-        dea = TechnicalAnalysis.calculate_ema(dif, signal)
-        
-        if not dif or not dea:
+        ema_fast, ema_slow, dea = TechnicalAnalysis.macd_state(prices, fast, slow, signal)
+        dif = ema_fast - ema_slow
+        return {"dif": dif, "dea": dea, "macd": (dif - dea) * 2}
+    
+    @staticmethod
+    def macd_state(prices: List[float], fast: int = 12, slow: int = 26, signal: int = 9) -> Optional[Tuple[float, float, float]]:
+        """计算 MACD 递推状态 (ema_fast, ema_slow, dea)，供后续逐价更新"""
+        if not prices:
             return None
-
-        # 取最新值
-        curr_dif = dif[-1]
-        curr_dea = dea[-1]
-        curr_macd = (curr_dif - curr_dea) * 2
-        
-        return {"dif": curr_dif, "dea": curr_dea, "macd": curr_macd}
-
+        # 只需要最终值：快慢 EMA 和 DEA 在一次遍历中用标量同时递推，不生成中间列表
+        m_fast, m_slow, m_signal = 2 / (fast + 1), 2 / (slow + 1), 2 / (signal + 1)
+        ema_fast = ema_slow = prices[0]
+        dea = 0.0  # 首个 DIF 为 0，DEA 以其为初值
+        for price in prices[1:]:
+            ema_fast += (price - ema_fast) * m_fast
+            ema_slow += (price - ema_slow) * m_slow
+            dea += (ema_fast - ema_slow - dea) * m_signal
+        return ema_fast, ema_slow, dea
+    
+    @staticmethod
+    def macd_update(state: Tuple[float, float, float], price: float, fast: int = 12, slow: int = 26, signal: int = 9) -> Dict[str, float]:
+        """在状态基础上追加一个价格，O(1) 得到最新 MACD（不修改状态）"""
+        ema_fast, ema_slow, dea = state
+        ema_fast += (price - ema_fast) * 2 / (fast + 1)
+        ema_slow += (price - ema_slow) * 2 / (slow + 1)
+        dif = ema_fast - ema_slow
+        dea += (dif - dea) * 2 / (signal + 1)
+        return {"dif": dif, "dea": dea, "macd": (dif - dea) * 2}
+    
     @staticmethod
     def calculate_rsi(prices: List[float], period: int = 6) -> Optional[float]:
-        """计算RSI指标"""
+        """计算RSI指标（Wilder 平滑）"""
+        state = TechnicalAnalysis.rsi_state(prices, period)
+        if state is None:
+            return None
+        return TechnicalAnalysis.rsi_value(state)
+    
+    @staticmethod
+    def rsi_state(prices: List[float], period: int = 6) -> Optional[Tuple[float, float, float]]:
+        """计算 Wilder RSI 的平滑状态 (avg_gain, avg_loss, last_price)"""
         if len(prices) < period + 1:
             return None
         
-        deltas = [prices[i] - prices[i-1] for i in range(1, len(prices))]
-        gains = [d for d in deltas[-period:] if d > 0]
-        losses = [-d for d in deltas[-period:] if d < 0]
-        
-        avg_gain = sum(gains) / period if gains else 0
-        avg_loss = sum(losses) / period if losses else 0
-        
+        # 前 period 个涨跌幅取简单平均作为初值
+        gain_sum = loss_sum = 0.0
+        for i in range(1, period + 1):
+            delta = prices[i] - prices[i - 1]
+            if delta > 0:
+                gain_sum += delta
+            else:
+                loss_sum -= delta
+        avg_gain = gain_sum / period
+        avg_loss = loss_sum / period
+        
+        # 之后按 RMA (α=1/period) 递推；长历史时这里是热点，用局部变量内联计算
+        keep = period - 1
+        prev = prices[period]
+        for price in prices[period + 1:]:
+            delta = price - prev
+            if delta > 0:
+                avg_gain = (avg_gain * keep + delta) / period
+                avg_loss = avg_loss * keep / period
+            else:
+                avg_gain = avg_gain * keep / period
+                avg_loss = (avg_loss * keep - delta) / period
+            prev = price
+        return avg_gain, avg_loss, prev
+    
+    @staticmethod
+    def rsi_update(state: Tuple[float, float, float], price: float, period: int = 6) -> Tuple[float, float, float]:
+        """用一个新价格 O(1) 递推 RSI 状态"""
+        avg_gain, avg_loss, last_price = state
+        delta = price - last_price
+        avg_gain = (avg_gain * (period - 1) + max(delta, 0)) / period
+        avg_loss = (avg_loss * (period - 1) + max(-delta, 0)) / period
+        return avg_gain, avg_loss, price
+    
+    @staticmethod
+    def rsi_value(state: Tuple[float, float, float]) -> float:
+        """由平滑状态计算 RSI 数值"""
+        avg_gain, avg_loss, _ = state
         if avg_loss == 0:
             return 100 if avg_gain > 0 else 0
         
@@ -406,8 +672,8 @@ class TechnicalAnalysis:
         # 计算中轨 (MA)
         mb = sum(recent_prices) / period
         
-        # 计算标准差
-        variance = sum([((x - mb) ** 2) for x in recent_prices]) / period
+        # 计算标准差（生成器求和，不构造临时列表）
+        variance = sum((x - mb) * (x - mb) for x in recent_prices) / period
         std = variance ** 0.5
         
         # 计算上轨和下轨
@@ -433,12 +699,24 @@ class TechnicalAnalysis:
 
 # ===== 飞书消息发送 =====
 class FeishuNotifier:
+    # 卡片消息骨架固定，预先写成 JSON 字节模板，发送时只填入 标题 / 颜色 / 内容
+    CARD_TEMPLATE = (
+        b'{"msg_type":"interactive","card":{"config":{"wide_screen_mode":true},'
+        b'"header":{"title":{"tag":"plain_text","content":%b},"template":%b},'
+        b'"elements":[{"tag":"div","text":{"tag":"lark_md","content":%b}}]}}'
+    )
+    JSON_HEADERS = {"Content-Type": "application/json; charset=utf-8"}
+    
     def __init__(self, webhook_url: str, app_id: str = "", app_secret: str = ""):
         self.webhook_url = webhook_url
         self.app_id = app_id
         self.app_secret = app_secret
         self.access_token = None
         self.token_expire_time = 0
+        self._token_lock = threading.Lock()  # 避免多个线程同时刷新token
+        # 卡片消息异步发送：调用方只入队，由后台线程 POST，飞书慢响应不阻塞监控循环
+        self._msg_queue: "queue.Queue[Tuple[str, bytes]]" = queue.Queue()
+        threading.Thread(target=self._send_worker, daemon=True).start()
     
     def get_tenant_access_token(self):
         """获取 tenant_access_token（用于主动发消息）"""
@@ -446,24 +724,35 @@ class FeishuNotifier:
             return None
         
         # 检查token是否过期
-        if self.access_token and time.time() < self.token_expire_time:
+        if self.access_token and time.monotonic() < self.token_expire_time:
             return self.access_token
         
-        url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
-        data = {
-            "app_id": self.app_id,
-            "app_secret": self.app_secret
-        }
-        
-        try:
-            resp = requests.post(url, json=data, timeout=5)
-            result = resp.json()
-            if result.get("code") == 0:
-                self.access_token = result["tenant_access_token"]
-                self.token_expire_time = time.time() + result.get("expire", 7200) - 300
+        with self._token_lock:
+            # 等锁期间可能已被其他线程刷新
+            if self.access_token and time.monotonic() < self.token_expire_time:
                 return self.access_token
-        except Exception as e:
-            print(f"[ERROR] 获取token失败: {e}")
+            
+            url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
+            data = {
+                "app_id": self.app_id,
+                "app_secret": self.app_secret
+            }
+            
+            try:
+                resp = SESSION.post(url, json=data, timeout=5)
+                result = resp.json()
+                if result.get("code") == 0:
+                    self.access_token = result["tenant_access_token"]
+                    # 提前5分钟过期，留出刷新余量；用单调时钟，系统校时不会让token提前或延后失效
+                    self.token_expire_time = time.monotonic() + result.get("expire", 7200) - 300
+                    return self.access_token
+                logger.error("获取token失败: %s", result.get('msg'))
+            except Exception as e:
+                logger.error("获取token失败: %s", e)
+            
+            # 获取失败时清空缓存，下次重新获取
+            self.access_token = None
+            self.token_expire_time = 0
         
         return None
     
@@ -471,52 +760,58 @@ class FeishuNotifier:
         """回复消息"""
         token = self.get_tenant_access_token()
         if not token:
-            print("[WARN] 未配置APP凭证，无法回复消息")
+            logger.warning("未配置APP凭证，无法回复消息")
             return False
         
         url = f"https://open.feishu.cn/open-apis/im/v1/messages/{message_id}/reply"
         headers = {
             "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
+            "Content-Type": "application/json; charset=utf-8"
         }
         data = {
-            "content": json.dumps({"text": content}),
+            "content": _json_dumps({"text": content}).decode('utf-8'),
             "msg_type": "text"
         }
         
         try:
-            resp = requests.post(url, headers=headers, json=data, timeout=5)
+            resp = SESSION.post(url, headers=headers, data=_json_dumps(data), timeout=5)
             resp.raise_for_status()
             return True
         except Exception as e:
-            print(f"[ERROR] 回复消息失败: {e}")
+            logger.error("回复消息失败: %s", e)
             return False
     
     def send_card(self, title: str, content: str, color: str = "red"):
-        """发送飞书卡片消息"""
-        msg = {
-            "msg_type": "interactive",
-            "card": {
-                "config": {"wide_screen_mode": True},
-                "header": {
-                    "title": {"tag": "plain_text", "content": title},
-                    "template": color
-                },
-                "elements": [
-                    {"tag": "div", "text": {"tag": "lark_md", "content": content}}
-                ]
-            }
-        }
-        
+        """发送飞书卡片消息（入队后立即返回，由后台线程发送）"""
+        # 模板中只替换三个 JSON 字符串字面量（含引号和转义），不再序列化整个嵌套字典
+        body = self.CARD_TEMPLATE % (_json_dumps(title), _json_dumps(color), _json_dumps(content))
+        self._msg_queue.put((title, body))
+        return True
+    
+    def _send_worker(self):
+        """后台发送线程，按入队顺序逐条发送"""
+        while True:
+            title, body = self._msg_queue.get()
+            try:
+                self._post_card(title, body)
+            finally:
+                self._msg_queue.task_done()
+    
+    def _post_card(self, title: str, body: bytes) -> bool:
+        """实际发送卡片消息"""
         try:
-            resp = requests.post(self.webhook_url, json=msg, timeout=5)
+            resp = SESSION.post(self.webhook_url, data=body, headers=self.JSON_HEADERS, timeout=5)
             resp.raise_for_status()
-            print(f"[INFO] 飞书消息发送成功: {title}")
+            logger.info("飞书消息发送成功: %s", title)
             return True
         except Exception as e:
-            print(f"[ERROR] 飞书消息发送失败: {e}")
+            logger.error("飞书消息发送失败: %s", e)
             return False
     
+    def flush(self):
+        """等待已入队的消息全部发送完毕（退出前调用）"""
+        self._msg_queue.join()
+    
     def send_alert(self, stock_name: str, stock_code: str, alerts: List[str], stock_data: Dict):
         """发送异动提醒"""
         change_pct = (stock_data["price"] - stock_data["pre_close"]) / stock_data["pre_close"] * 100
@@ -536,7 +831,7 @@ class FeishuNotifier:
         
         self.send_card("【股票异动提醒】", content, color)
     
-    def send_stock_list(self, stocks: List[Dict]):
+    def send_stock_list(self, stocks: List[sqlite3.Row]):
         """发送监控列表"""
         if not stocks:
             content = "📭 当前没有监控的股票"
@@ -549,65 +844,114 @@ class FeishuNotifier:
 
 # ===== 股票监控器 =====
 class StockMonitor:
+    ALERT_COOLDOWN = 1800      # 同类预警冷却时间(秒)，30分钟
+    ALERT_COOLDOWN_MAX = 4096  # 冷却记录最多保留条数
+    
     def __init__(self, db: Database, notifier: FeishuNotifier, config: Config):
         self.db = db
         self.notifier = notifier
         self.config = config
-        self.running = False
-        self.alert_cooldown = {}  # 预警冷却时间（避免频繁提醒）
+        self._stop = threading.Event()
+        self._stop.set()  # 未启动时视为已停止
+        self._wake = threading.Event()  # 停止或修改间隔时唤醒等待中的监控循环
+        # 预警冷却时间（避免频繁提醒），按触发时间从旧到新排列，容量有上限
+        self.alert_cooldown: "OrderedDict[str, float]" = OrderedDict()
+        self._cooldown_lock = threading.Lock()
         self.has_triggered_alert = False  # 本次检查是否触发过预警
+        self._executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS)  # 并发监控多只股票
+        # 代码 -> 日K指标状态 {date, rsi, macd, boll}，每天只拉取一次K线
+        self._kline_cache: Dict[str, Dict] = {}
+        # 持仓配置按标准化代码建索引，避免每次检查都模糊遍历
+        self._positions_by_normcode = {
+            StockDataFetcher.normalize_code(k): v for k, v in config.USER_POSITIONS.items()
+        }
     
     def check_alert_cooldown(self, code: str, alert_type: str) -> bool:
         """检查预警冷却时间（30分钟内同类型预警只发一次）"""
         key = f"{code}:{alert_type}"
         now = time.time()
         
-        if key in self.alert_cooldown:
-            if now - self.alert_cooldown[key] < 1800:  # 30分钟
+        with self._cooldown_lock:
+            # 按 TTL 淘汰已过冷却期的记录（最旧的在最前面，遇到未过期的即可停止）
+            while self.alert_cooldown:
+                oldest = next(iter(self.alert_cooldown))
+                if now - self.alert_cooldown[oldest] < self.ALERT_COOLDOWN:
+                    break
+                self.alert_cooldown.popitem(last=False)
+            
+            # 剩下的都在冷却期内
+            if key in self.alert_cooldown:
                 return False
-        
-        self.alert_cooldown[key] = now
+            
+            self.alert_cooldown[key] = now
+            if len(self.alert_cooldown) > self.ALERT_COOLDOWN_MAX:
+                self.alert_cooldown.popitem(last=False)
         return True
     
-    def monitor_single_stock(self, stock: Dict) -> Optional[Dict]:
-        """监控单只股票 (BOLL + RSI + MACD)"""
+    @staticmethod
+    def _trade_date(data: Dict) -> str:
+        """实时行情对应的交易日 (YYYY-MM-DD)，行情时间缺失时退回本地日期"""
+        quote_time = data.get("time", "")
+        if len(quote_time) >= 8 and quote_time[:8].isdigit():
+            return f"{quote_time[:4]}-{quote_time[4:6]}-{quote_time[6:8]}"
+        return datetime.now().strftime('%Y-%m-%d')
+    
+    def get_indicator_state(self, code: str, today: str) -> Optional[Dict]:
+        """获取日K线指标状态，同一交易日内复用缓存，交易日变化时才重新拉取K线"""
+        cache = self._kline_cache.get(code)
+        if cache and cache["date"] == today:
+            return cache
+        
+        history = StockDataFetcher.get_kline_history(code, scale='day', limit=60)
+        if not history:
+            return None  # 获取失败不缓存，下次重试
+        
+        # 只用已收盘的K线；当天的K线由实时价代替
+        close_prices = [h["close"] for h in history if h["date"] != today]
+        cache = {"date": today, "rsi": None, "macd": None, "boll": None}
+        if len(close_prices) + 1 >= 30:  # 至少需要30天数据计算MACD
+            cache["rsi"] = TechnicalAnalysis.rsi_state(close_prices, self.config.RSI_PERIOD)
+            boll = RollingBoll(self.config.BOLL_PERIOD, self.config.BOLL_STD)
+            for price in close_prices[-(self.config.BOLL_PERIOD - 1):]:
+                boll.push(price)
+            cache["boll"] = boll if boll.ready else None
+            if len(close_prices) + 1 >= 26 + 9:
+                cache["macd"] = TechnicalAnalysis.macd_state(close_prices)
+        self._kline_cache[code] = cache
+        return cache
+    
+    def monitor_single_stock(self, stock: sqlite3.Row, data: Optional[Dict] = None) -> Optional[Dict]:
+        """监控单只股票 (BOLL + RSI + MACD)，data 为已批量获取的实时行情"""
         code = stock["code"]
         name = stock["name"]
         
-        # 获取用户持仓信息
-        user_pos = self.config.USER_POSITIONS.get(code)
-        # 如果代码不匹配（比如 sh601015 vs 601015），尝试模糊匹配
-        if not user_pos:
-            for k, v in self.config.USER_POSITIONS.items():
-                if k in code or code in k:
-                    user_pos = v
-                    break
+        # 获取用户持仓信息（按标准化代码匹配，sh601015 与 601015 视为同一只）
+        user_pos = self._positions_by_normcode.get(StockDataFetcher.normalize_code(code))
         
-        # 1. 获取实时数据
-        data = StockDataFetcher.get_stock_data(code)
+        # 1. 获取实时数据（未预先获取时单独请求）
+        if data is None:
+            data = StockDataFetcher.get_stock_data(code)
         if not data or data["price"] == 0:
             return None
             
         current_price = data["price"]
         change_pct = (current_price - data["pre_close"]) / data["pre_close"] * 100
         
-        # 2. 获取K线历史 (用于计算指标)
-        history = StockDataFetcher.get_kline_history(code, scale='day', limit=60)
+        # 2. 日K线指标状态（每个交易日拉取一次），实时价只做 O(1) 递推
+        # 以行情的交易日为准：周末/节假日不会重复拉取，也不会把最后一根K线和实时价重复计算
+        state = self.get_indicator_state(code, self._trade_date(data))
         
         alerts = []
         rsi_val = None
         boll = None
         macd = None
         
-        if history and len(history) >= 30: # 至少需要30天数据计算MACD
-            # 提取收盘价列表
-            close_prices = [h["close"] for h in history]
-            close_prices.append(current_price)
-            
+        if state and state["rsi"] and state["boll"]:
             # 计算指标
-            rsi_val = TechnicalAnalysis.calculate_rsi(close_prices, self.config.RSI_PERIOD)
-            boll = TechnicalAnalysis.calculate_boll(close_prices, self.config.BOLL_PERIOD, self.config.BOLL_STD)
-            macd = TechnicalAnalysis.calculate_macd(close_prices)
+            rsi_val = TechnicalAnalysis.rsi_value(TechnicalAnalysis.rsi_update(state["rsi"], current_price, self.config.RSI_PERIOD))
+            boll = state["boll"].update(current_price)
+            if state["macd"]:
+                macd = TechnicalAnalysis.macd_update(state["macd"], current_price)
             
             # === 策略逻辑 ===
             if boll and rsi_val is not None and macd:
@@ -653,7 +997,7 @@ class StockMonitor:
                         alerts.append(f"🔴 顶部风险信号: BOLL上轨 + RSI超买")
 
         # 3. 暴涨暴跌兜底预警
-        if abs(change_pct) > 7:
+        if abs(change_pct) > self.config.PRICE_CHANGE_THRESHOLD:
              emoji = "🚀" if change_pct > 0 else "💥"
              alerts.append(f"{emoji} 股价剧烈波动: {change_pct:+.2f}%")
 
@@ -674,6 +1018,12 @@ class StockMonitor:
             msg_content += f"📊 指标: RSI={rsi_val:.1f} | MACD={macd['macd']:.3f}\n"
             msg_content += f"📏 布林: 上{boll['up']:.2f} / 中{boll['mb']:.2f} / 下{boll['dn']:.2f}\n"
         
+        # 同一组信号在冷却期内只提醒一次；签名取每条信号冒号前的类型，不含会变化的数值
+        if alerts:
+            signature = "|".join(a.split(":", 1)[0] for a in alerts)
+            if not self.check_alert_cooldown(code, signature):
+                alerts = []
+        
         if alerts:
             msg_content += "\n⚠️ **建议操作:**\n" + "\n".join(alerts)
             # 有建议时，发送红色/绿色卡片
@@ -694,6 +1044,14 @@ class StockMonitor:
             "has_alert": bool(alerts)
         }
     
+    def _monitor_safely(self, stock: sqlite3.Row, data: Optional[Dict]) -> Optional[Dict]:
+        """线程池任务：单只股票异常不影响其他股票"""
+        try:
+            return self.monitor_single_stock(stock, data)
+        except Exception as e:
+            logger.error("监控 %s 异常: %s", stock['code'], e)
+            return None
+    
     def check_all_stocks(self):
         """检查所有股票一次"""
         self.has_triggered_alert = False  # 重置标记
@@ -701,45 +1059,98 @@ class StockMonitor:
         try:
             stocks = self.db.get_all_stocks()
             if not stocks:
-                print("[INFO] 没有监控的股票，等待添加...")
+                logger.info("没有监控的股票，等待添加...")
             else:
-                print(f"[INFO] {datetime.now().strftime('%H:%M:%S')} 开始检查 {len(stocks)} 只股票...")
-                for stock in stocks:
-                    self.monitor_single_stock(stock)
-                    monitored_list.append(stock)
+                logger.info("开始检查 %s 只股票...", len(stocks))
+                # 一次请求获取全部实时行情
+                quotes = StockDataFetcher.get_many([s["code"] for s in stocks])
+                # K线获取与消息发送是网络 I/O，分发到线程池并发执行
+                # 批量结果中缺失的股票退回单独请求；等待全部完成后本轮才结束
+                list(self._executor.map(
+                    self._monitor_safely,
+                    stocks,
+                    [quotes.get(StockDataFetcher.normalize_code(s["code"])) for s in stocks],
+                ))
+                monitored_list.extend(stocks)
         except Exception as e:
-            print(f"[ERROR] 监控检查异常: {e}")
+            logger.error("监控检查异常: %s", e)
         return monitored_list
 
+    @property
+    def running(self) -> bool:
+        """监控是否在运行"""
+        return not self._stop.is_set()
+    
     def monitor_loop(self):
         """监控主循环"""
-        while self.running:
+        # 按固定节拍调度：下一次检查时间 = 上一次计划时间 + 间隔，检查耗时不会累积成漂移
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
             self.check_all_stocks()
-            time.sleep(self.config.CHECK_INTERVAL)
+            last_tick = next_tick
+            # 检查耗时超过一个间隔时从当前时间重新对齐，避免连续补跑
+            next_tick = max(last_tick + self.config.CHECK_INTERVAL, time.monotonic())
+            # 用 Event 等待而非 sleep：stop() 可立即唤醒退出，reschedule() 可按新间隔重新计时
+            while self._wake.wait(max(next_tick - time.monotonic(), 0)):
+                self._wake.clear()
+                if self._stop.is_set():
+                    return
+                next_tick = max(last_tick + self.config.CHECK_INTERVAL, time.monotonic())
+    
+    def reschedule(self):
+        """检查间隔修改后调用，让正在等待的监控循环按新间隔重新计算下一次检查时间"""
+        self._wake.set()
     
     def start(self):
         """启动监控"""
         if self.running:
             return
         
-        self.running = True
+        self._stop.clear()
+        self._wake.clear()
         thread = threading.Thread(target=self.monitor_loop, daemon=True)
         thread.start()
-        print("🚀 股票监控已启动")
+        logger.info("🚀 股票监控已启动")
     
     def stop(self):
         """停止监控"""
-        self.running = False
-        print("🛑 股票监控已停止")
+        self._stop.set()
+        self._wake.set()
+        logger.info("🛑 股票监控已停止")
 
 
 # ===== 命令处理器 =====
+# 命令文本：可选的 @机器人 前缀 + 命令词 + 第一个参数（其余内容忽略）
+_CMD_RE = re.compile(r"^\s*(?:@_user_\d+\s*)*(?!@_user_\d)(\S+)(?:\s+(\S+))?")
+
+
 class CommandHandler:
     def __init__(self, db: Database, notifier: FeishuNotifier, monitor: StockMonitor, config: Config):
         self.db = db
         self.notifier = notifier
         self.monitor = monitor
         self.config = config
+        
+        set_interval = self._int_arg(self.handle_set_interval)
+        set_overbought = self._int_arg(lambda v: self.handle_set_rsi(overbought=v))
+        set_oversold = self._int_arg(lambda v: self.handle_set_rsi(oversold=v))
+        # 命令词 -> (处理函数, 是否需要参数)
+        self._commands = {
+            "add": (self.handle_add, True),
+            "remove": (self.handle_remove, True),
+            "list": (self.handle_list, False),
+            "status": (self.handle_status, False),
+            "config": (self.handle_config, False),
+            "改间隔": (set_interval, True),
+            "间隔": (set_interval, True),
+            "改超买": (set_overbought, True),
+            "超买": (set_overbought, True),
+            "改超卖": (set_oversold, True),
+            "超卖": (set_oversold, True),
+            "help": (self.handle_help, False),
+            "帮助": (self.handle_help, False),
+            "?": (self.handle_help, False),
+        }
     
     def handle_add(self, code: str) -> str:
         """添加股票"""
@@ -793,6 +1204,7 @@ class CommandHandler:
         if interval < 10 or interval > 600:
             return "❌ 间隔应在 10-600 秒之间"
         self.config.CHECK_INTERVAL = interval
+        self.monitor.reschedule()
         return f"✅ 检查间隔已改为: {interval}秒"
     
     def handle_set_rsi(self, overbought: int = None, oversold: int = None) -> str:
@@ -832,77 +1244,57 @@ class CommandHandler:
     
     def parse_command(self, text: str) -> str:
         """解析并执行命令"""
-        text = text.strip().lower()
-        parts = text.split()
-        
-        if not parts:
+        # 一次匹配去掉开头的 @机器人，取出命令词和第一个参数
+        m = _CMD_RE.match(text.lower())
+        if not m:
             return self.handle_help()
-        
-        cmd = parts[0]
-        
-        # 添加股票
-        if cmd == "add" and len(parts) > 1:
-            return self.handle_add(parts[1])
-        
-        # 移除股票
-        elif cmd == "remove" and len(parts) > 1:
-            return self.handle_remove(parts[1])
-        
-        # 查看列表
-        elif cmd == "list":
-            return self.handle_list()
-        
-        # 查看状态
-        elif cmd == "status":
-            return self.handle_status()
-        
-        # 查看配置
-        elif cmd == "config":
-            return self.handle_config()
-        
-        # 修改间隔
-        elif cmd in ["改间隔", "间隔"] and len(parts) > 1:
-            try:
-                return self.handle_set_interval(int(parts[1]))
-            except ValueError:
-                return "❌ 请输入有效的数字"
-        
-        # 修改RSI
-        elif cmd in ["改超买", "超买"] and len(parts) > 1:
-            try:
-                return self.handle_set_rsi(overbought=int(parts[1]))
-            except ValueError:
-                return "❌ 请输入有效的数字"
-        
-        elif cmd in ["改超卖", "超卖"] and len(parts) > 1:
+        return self.dispatch(m.group(1), m.group(2) or "")
+    
+    def dispatch(self, verb: str, arg: str = "") -> str:
+        """按命令表执行命令，arg 为命令的第一个参数"""
+        entry = self._commands.get(verb)
+        if not entry or (entry[1] and not arg):
+            return f"❓ 未知命令: {verb}\n\n发送 @我 help 查看帮助"
+        func, needs_arg = entry
+        return func(arg) if needs_arg else func()
+    
+    @staticmethod
+    def _int_arg(func):
+        """包装需要整数参数的命令"""
+        def run(arg: str) -> str:
             try:
-                return self.handle_set_rsi(oversold=int(parts[1]))
+                value = int(arg)
             except ValueError:
                 return "❌ 请输入有效的数字"
-        
-        # 帮助
-        elif cmd in ["help", "帮助", "?"]:
-            return self.handle_help()
-        
-        else:
-            return f"❓ 未知命令: {cmd}\n\n发送 @我 help 查看帮助"
+            return func(value)
+        return run
 
 
 # ===== 飞书消息接收服务器 =====
 class FeishuWebhookHandler(BaseHTTPRequestHandler):
     """处理飞书事件回调"""
     
-    command_handler = None  # 将由外部设置
-    notifier = None
-    config = None
+    command_queue: "Optional[queue.Queue[Tuple[str, str]]]" = None  # (message_id, 文本)，由后台线程处理
+    
+    OK_BODY = b'{"code": 0}'  # 固定的成功响应，无需每次序列化
+    COMMAND_QUEUE_SIZE = 100  # 待执行命令的最大积压条数
+    MAX_BODY_SIZE = 1024 * 1024  # 飞书事件体通常只有几KB，超过1MB直接拒绝
+    HANDLED_MARKERS = (b"url_verification", b"im.message.receive_v1")  # 需要处理的事件在原始请求体中的特征
     
     def do_POST(self):
         """处理POST请求"""
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
+        post_data = self._read_body()
+        if post_data is None:
+            return
         
         try:
-            data = json.loads(post_data.decode('utf-8'))
+            # 只关心 URL 验证和收消息两类事件，其他事件（已读回执、进群等）不做完整解析直接确认
+            if not any(marker in post_data for marker in self.HANDLED_MARKERS):
+                self._send_ok()
+                return
+            
+            # 直接解析 bytes（自动识别 UTF-8），省去一次解码拷贝
+            data = _json_loads(post_data)
             
             # URL验证
             if data.get("type") == "url_verification":
@@ -910,7 +1302,7 @@ class FeishuWebhookHandler(BaseHTTPRequestHandler):
                 self.send_response(200)
                 self.send_header('Content-Type', 'application/json')
                 self.end_headers()
-                self.wfile.write(json.dumps({"challenge": challenge}).encode())
+                self.wfile.write(_json_dumps({"challenge": challenge}))
                 return
             
             # 处理消息事件
@@ -920,47 +1312,111 @@ class FeishuWebhookHandler(BaseHTTPRequestHandler):
                 
                 # 只处理文本消息
                 if message.get("message_type") == "text":
-                    content = json.loads(message.get("content", "{}"))
+                    content = _json_loads(message.get("content") or "{}")
+                    # 开头的 @机器人 由 parse_command 统一去除
                     text = content.get("text", "").strip()
                     message_id = message.get("message_id", "")
                     
-                    # 移除 @机器人 的部分
-                    text = text.replace("@_user_1", "").strip()
+                    logger.info("收到消息: %s", text)
                     
-                    print(f"[INFO] 收到消息: {text}")
-                    
-                    # 处理命令
-                    if self.command_handler:
-                        response = self.command_handler.parse_command(text)
-                        
-                        # 回复消息
-                        if response and self.notifier:
-                            self.notifier.reply_message(message_id, response)
+                    # 命令执行和回复交给后台线程，这里立即确认，避免飞书因超时重推事件
+                    if self.command_queue is not None:
+                        try:
+                            self.command_queue.put_nowait((message_id, text))
+                        except queue.Full:
+                            logger.warning("命令积压过多，丢弃消息: %s", text)
             
             # 响应成功
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"code": 0}).encode())
+            self._send_ok()
         
         except Exception as e:
-            print(f"[ERROR] 处理消息失败: {e}")
+            logger.error("处理消息失败: %s", e)
             self.send_response(500)
             self.end_headers()
     
+    def _read_body(self) -> Optional[bytearray]:
+        """按 Content-Length 一次性读入预分配缓冲区；长度非法或过大时直接返回错误"""
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            content_length = -1
+        if content_length <= 0:
+            self.send_response(400)
+            self.end_headers()
+            return None
+        if content_length > self.MAX_BODY_SIZE:
+            self.send_response(413)
+            self.end_headers()
+            return None
+        
+        buf = bytearray(content_length)
+        received = 0
+        with memoryview(buf) as view:
+            while received < content_length:
+                n = self.rfile.readinto(view[received:])
+                if not n:
+                    break  # 对端提前关闭连接
+                received += n
+        if received < content_length:
+            self.send_response(400)
+            self.end_headers()
+            return None
+        return buf
+    
+    def _send_ok(self):
+        """返回固定的成功响应"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(self.OK_BODY)
+    
     def log_message(self, format, *args):
         """禁用默认日志"""
         pass
+    
+    def log_request(self, code='-', size='-'):
+        """不记录访问日志（跳过地址与时间格式化）"""
+        pass
+    
+    def log_error(self, format, *args):
+        """不记录默认错误日志，处理异常已由 logger 记录"""
+        pass
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """飞书回调服务器：在 ThreadingHTTPServer（每个请求一个守护线程）基础上加长监听队列，应对事件突发"""
+    request_queue_size = 128  # 默认仅为5，突发回调时新连接会被内核拒绝
+
+
+def _command_worker(commands: "queue.Queue[Tuple[str, str]]", handler: CommandHandler, notifier: FeishuNotifier):
+    """后台命令线程：按收到的顺序执行命令并回复"""
+    while True:
+        message_id, text = commands.get()
+        try:
+            response = handler.parse_command(text)
+            if response:
+                notifier.reply_message(message_id, response)
+        except Exception as e:
+            logger.error("处理命令失败: %s", e)
+        finally:
+            commands.task_done()
 
 
 def start_webhook_server(handler: CommandHandler, notifier: FeishuNotifier, config: Config):
     """启动Webhook服务器"""
-    FeishuWebhookHandler.command_handler = handler
-    FeishuWebhookHandler.notifier = notifier
-    FeishuWebhookHandler.config = config
+    # 命令执行和回复不占用请求线程；队列有上限，积压时新命令直接丢弃，不会无限堆积
+    FeishuWebhookHandler.command_queue = queue.Queue(maxsize=FeishuWebhookHandler.COMMAND_QUEUE_SIZE)
+    # 有意只用一个工作线程：命令按收到的顺序串行执行（add/remove 与 list 不会乱序），
+    # 代价是一条慢命令（如 add 时拉取行情）会推迟其后的命令
+    threading.Thread(
+        target=_command_worker,
+        args=(FeishuWebhookHandler.command_queue, handler, notifier),
+        daemon=True,
+    ).start()
     
-    server = HTTPServer(('0.0.0.0', config.HTTP_PORT), FeishuWebhookHandler)
-    print(f"🌐 Webhook服务器启动: http://0.0.0.0:{config.HTTP_PORT}")
+    # 每个请求独立线程处理，慢连接不会阻塞后续飞书事件（飞书要求3秒内响应）
+    server = WebhookServer(('0.0.0.0', config.HTTP_PORT), FeishuWebhookHandler)
+    logger.info("🌐 Webhook服务器启动: http://0.0.0.0:%s", config.HTTP_PORT)
     
     # 在后台线程运行
     thread = threading.Thread(target=server.serve_forever, daemon=True)
@@ -969,10 +1425,9 @@ def start_webhook_server(handler: CommandHandler, notifier: FeishuNotifier, conf
     return server
 
 
-import sys
-
 # ===== 主程序 =====
 def main():
+    setup_logging()
     print("=" * 50)
     print("🤖 飞书股票监控机器人 v1.0")
     print("=" * 50)
@@ -1013,6 +1468,8 @@ def main():
                 "yellow"
             )
             
+        # 等待后台线程把消息发完再退出
+        notifier.flush()
         print("✅ 单次检查完成")
         return
 
@@ -1055,41 +1512,28 @@ def main():
     print("  remove 600519     - 移除监控股票")
     print("  list              - 查看监控列表")
     print("  status            - 查看运行状态")
+    print("  help              - 查看全部命令")
     print("  quit              - 退出程序\n")
     
     while True:
         try:
-            cmd = input(">>> ").strip().split()
-            if not cmd:
+            # 与飞书消息共用同一套命令解析和命令表
+            m = _CMD_RE.match(input(">>> ").lower())
+            if not m:
                 continue
             
-            command = cmd[0].lower()
-            
-            if command == "add" and len(cmd) > 1:
-                result = handler.handle_add(cmd[1])
-                print(result)
-            
-            elif command == "remove" and len(cmd) > 1:
-                result = handler.handle_remove(cmd[1])
-                print(result)
-            
-            elif command == "list":
-                handler.handle_list()
-            
-            elif command == "status":
-                result = handler.handle_status()
-                print(result)
-            
-            elif command == "quit":
+            verb = m.group(1)
+            if verb == "quit":
                 monitor.stop()
+                notifier.flush()
                 print("👋 再见！")
                 break
             
-            else:
-                print("❌ 未知命令")
+            print(handler.dispatch(verb, m.group(2) or ""))
         
         except KeyboardInterrupt:
             monitor.stop()
+            notifier.flush()  # 发完队列中剩余的卡片再退出
             print("\n👋 再见！")
             break
         except Exception as e:
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+批量添加监控股票
+用法：编辑下面的 stocks 列表，然后运行 python init_stocks.py
+"""
+
+from feishu_stock_bot import Config, Database, StockDataFetcher, setup_logging
+
+stocks = ["600519", "000001", "300750"]  # 你的股票列表
+
+
+def main():
+    setup_logging()
+    db = Database(Config.DB_PATH)
+
+    # 一次批量请求获取全部行情，一个事务写入数据库
+    quotes = StockDataFetcher.get_many(stocks)
+    db.add_stocks([(data["code"], data["name"]) for data in quotes.values()])
+
+    for data in quotes.values():
+        print(f"✅ 已添加: {data['name']} ({data['code']})")
+    for code in stocks:
+        if StockDataFetcher.normalize_code(code) not in quotes:
+            print(f"❌ 获取股票数据失败: {code}")
+
+    print(f"📊 共添加 {len(quotes)}/{len(stocks)} 只股票")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()